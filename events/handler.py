@@ -2,64 +2,139 @@
 Events Handler Service - Ingest And Read Events
 
 Routes:
-    POST /events:                       Validate, Store, enqueue SQS
+    POST /events:                       Validate, enqueue to ingest SQS
     GET /devices/{device_id}/events:    Query events
+    SQS drain_events:                   Batch store events, forward to rules SQS
 
 """
 
+import base64
 import logging
 import os
-from typing import Any
-import boto3
-from botocore.endpoint import uuid
-from botocore.exceptions import ClientError
-from pydantic import BaseModel, Field, ValidationError, field_validator
-from decimal import Decimal
-from time import time
-import json
-from boto3.dynamodb.conditions import Key
+import random
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Annotated, Any
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+import msgspec
+from time import monotonic, sleep, time
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-
-_dyndb = boto3.resource("dynamodb")
-_sqs = boto3.resource("sqs")
-
 EVENTS_TABLE = os.environ["EVENTS_TABLE"]
 SQS_QUEUE_URL = os.environ["SQS_QUEUE_URL"]
-
-_queue = _sqs.Queue(SQS_QUEUE_URL)
-
-_table = _dyndb.Table(EVENTS_TABLE)
-
-
-class EventPayload(BaseModel):
+INGEST_QUEUE_URL = os.environ["INGEST_QUEUE_URL"]
+
+# Bodies above this size are rejected before parsing
+MAX_BODY_BYTES = 16384
+
+# DynamoDB N range, magnitudes outside it are rejected by the whole batch write
+DDB_NUMBER_MAX = 1e126
+DDB_NUMBER_MIN = 1e-130
+# Longest base64 string that can decode to MAX_BODY_BYTES
+MAX_BODY_B64_CHARS = 4 * -(-MAX_BODY_BYTES // 3)
+
+# (device_id, ts) -> enqueue time of events this container accepted recently,
+# oldest first. Only a pre-filter for quick client retries, drain_events is the
+# duplicate check. Entries expire well before a failing message can exhaust its
+# retries into the DLQ (3 receives x 30s visibility), so that event can be resent
+RECENT_KEYS_MAX = 10_000
+RECENT_KEYS_TTL = 60.0
+_recent_keys: OrderedDict = OrderedDict()
+
+# BatchWriteItem accepts at most 25 put requests per call
+BATCH_WRITE_MAX = 25
+# BatchGetItem accepts at most 100 keys per call
+BATCH_GET_MAX = 100
+# SendMessageBatch accepts at most 10 entries per call
+SQS_BATCH_MAX = 10
+# Unprocessed items/keys retries: exponential backoff with full jitter (seconds)
+BATCH_RETRIES = 5
+BACKOFF_BASE = 0.05
+BACKOFF_CAP = 2.0
+
+# Query key conditions keyed by (from_ts given, to_ts given)
+KEY_CONDITIONS = {
+    (True, True): "PK = :pk AND SK BETWEEN :from_sk AND :to_sk",
+    (True, False): "PK = :pk AND SK >= :from_sk",
+    (False, True): "PK = :pk AND SK <= :to_sk",
+    (False, False): "PK = :pk",
+}
+# Upper bound on events per page, keeps a page well under the 1MB query cap
+MAX_QUERY_LIMIT = 100
+# Only the attributes returned to the client, PK/SK never leave DynamoDB
+EVENT_PROJECTION = "device_id, #t, #v, ts, ingested_at, request_id"
+EVENT_PROJECTION_NAMES = {"#t": "type", "#v": "value"}
+
+# Shared by every client: a keep-alive connection pool reused across warm
+# invocations, so requests skip the TCP/TLS handshake
+_boto_config = Config(
+    max_pool_connections=64,
+    retries={"max_attempts": 3, "mode": "adaptive"},
+    tcp_keepalive=True,
+    connect_timeout=1.0,
+    read_timeout=2.0,
+)
+
+
+# boto3 is imported and clients are built on first use, so each
+# Lambda only pays for the AWS services its route actually touches
+@lru_cache(maxsize=1)
+def _get_ddb():
+    import boto3
+
+    # Low-level client: items are sent in wire format, skipping TypeSerializer
+    return boto3.client("dynamodb", config=_boto_config)
+
+
+@lru_cache(maxsize=1)
+def _get_sqs():
+    import boto3
+
+    return boto3.client("sqs", config=_boto_config)
+
+
+class EventPayload(msgspec.Struct, frozen=True):
     """
     Incoming Events Schema
     """
 
-    device_id: str = Field(..., min_length=1, max_length=128)
-    type: str = Field(..., min_length=1, max_length=64)
-    value: float
-    ts: int = Field(..., description="Epoch milliseconds")
+    device_id: Annotated[str, msgspec.Meta(min_length=1, max_length=128)]
+    type: Annotated[str, msgspec.Meta(min_length=1, max_length=64)]
+    value: Annotated[float, msgspec.Meta(gt=-DDB_NUMBER_MAX, lt=DDB_NUMBER_MAX)]
+    ts: int  # Epoch milliseconds
     raw: dict | None = None
 
-    # non empty str fields
-    @field_validator("device_id", "type")
-    @classmethod
-    def not_empty(cls, v: str) -> str:
-        if not v.strip():
+    def __post_init__(self) -> None:
+        # non empty str fields
+        if not self.device_id.strip():
             raise ValueError("device_id cannot be empty")
-        return v
+        if not self.type.strip():
+            raise ValueError("type cannot be empty")
+
+        # Non zero values too small for a DynamoDB number
+        if self.value and abs(self.value) < DDB_NUMBER_MIN:
+            raise ValueError(f"value magnitude must be at least {DDB_NUMBER_MIN}")
 
-    # Ensure ts is positive
-    @field_validator("ts")
-    @classmethod
-    def ts_must_be_positive(cls, v: int) -> int:
-        if v <= 0:
+        # Ensure ts is positive
+        if self.ts <= 0:
             raise ValueError("ts must be a positive epoch millisecond value")
-        return v
+
+
+# Built once per container instead of resolving the type on every call.
+# Lax like the Pydantic model it replaced: numeric strings and whole floats
+# such as "23.5" or 1.0 are coerced instead of rejected
+_payload_decoder = msgspec.json.Decoder(EventPayload, strict=False)
+_msg_decoder = msgspec.json.Decoder()
+_msg_encoder = msgspec.json.Encoder()
+# Unknown types fall back to str, as json.dumps(default=str) did
+_response_encoder = msgspec.json.Encoder(enc_hook=str)
+
+
+# Shared, never mutated: responses without a request id reuse it as is
+_ANONYMOUS_HEADERS = {"Content-Type": "application/json", "X-Request-Id": ""}
 
 
 def _response(status: int, body: Any, request_id: str | None = None) -> dict:
@@ -69,28 +144,42 @@ def _response(status: int, body: Any, request_id: str | None = None) -> dict:
     payload = body if isinstance(body, dict) else {"message": body}
     if request_id:
         payload["request_id"] = request_id
+        headers = {"Content-Type": "application/json", "X-Request-Id": request_id}
+    else:
+        headers = _ANONYMOUS_HEADERS
 
     return {
         "statusCode": status,
-        "headers": {
-            "Content-Type": "application/json",
-            "X-Request-Id": request_id or "",
-        },
-        "body": json.dumps(payload, default=str),
+        "headers": headers,
+        "body": _response_encoder.encode(payload).decode(),
     }
 
 
 def _parse_body(event: dict) -> EventPayload:
     """
-    Convert the body from string to EventPayload Object
+    Convert the body from string or base64 to EventPayload Object
     """
     raw = event.get("body", None)
-    if isinstance(raw, str):
-        data = json.loads(raw)
-        return EventPayload(**data)
-    else:
+    if not isinstance(raw, str):
         raise ValueError("Message Body is required")
 
+    # Cheap checks first, oversized or non-object bodies never reach the parser.
+    # Length is checked before decoding: a char is at least one UTF-8 byte and
+    # base64 needs 4 chars per 3 bytes, so larger bodies cannot fit the limit
+    is_base64 = event.get("isBase64Encoded")
+    if len(raw) > (MAX_BODY_B64_CHARS if is_base64 else MAX_BODY_BYTES):
+        raise ValueError(f"Message Body exceeds {MAX_BODY_BYTES} bytes")
+
+    # Parse bytes either way, the exact size is known once encoded
+    raw = base64.b64decode(raw) if is_base64 else raw.encode()
+    if len(raw) > MAX_BODY_BYTES:
+        raise ValueError(f"Message Body exceeds {MAX_BODY_BYTES} bytes")
+    if raw[:1] != b"{":
+        raise ValueError("Message Body must be a JSON object")
+
+    # Parse and validate in one pass
+    return _payload_decoder.decode(raw)
+
 
 def ingest_event(event: dict, context: Any) -> dict:
     """
@@ -106,96 +195,82 @@ def ingest_event(event: dict, context: Any) -> dict:
     RULES: device_id+ts should be unique
     """
 
-    request_id = context.aws_request_id if context else str(uuid.uuid4())
-    logger.info("ingest_event called", extra={"request_id": request_id})
+    request_id = context.aws_request_id if context else os.urandom(16).hex()
 
     # Processing & Validate input
     try:
         payload = _parse_body(event)
 
-    # Raise Error for json errors
-    except json.JSONDecodeError as e:
-        logger.warning("Invalid JSON body", extra={"error": str(e)})
+    # Raise error: device_id == None or ts < 0
+    except msgspec.ValidationError as e:
+        logger.warning("Validation failed", extra={"errors": str(e)})
         return _response(
-            400, {"error": "Invalid JSON body", "detail": str(e)}, request_id
+            400, {"error": "Validation failed", "detail": str(e)}, request_id
         )
 
-    # Raise error: device_id == None or ts < 0
-    except ValidationError as e:
-        logger.warning("Validation failed", extra={"errors": e.errors()})
+    # Raise Error for json errors
+    except msgspec.DecodeError as e:
+        logger.warning("Invalid JSON body", extra={"error": str(e)})
         return _response(
-            400, {"error": "Validation failed", "detail": e.errors()}, request_id
+            400, {"error": "Invalid JSON body", "detail": str(e)}, request_id
         )
 
-    # Construct item for DynamoDB
-    pk = f"DEVICE#{payload.device_id}"
-    sk = f"TS#{payload.ts}"
+    # Raise error: missing, oversized or non-object body
+    except ValueError as e:
+        logger.warning("Invalid body", extra={"error": str(e)})
+        return _response(400, {"error": "Invalid body", "detail": str(e)}, request_id)
 
-    item = {
-        "PK": pk,
-        "SK": sk,
-        "device_id": payload.device_id,
-        "type": payload.type,
-        "value": Decimal(str(payload.value)),
-        "ts": payload.ts,
-        "ingested_at": Decimal(str(time() * 1000)),
-        "request_id": request_id,
-    }
-    if payload.raw:
-        item["raw"] = payload.raw
+    key = (payload.device_id, payload.ts)
+    now = monotonic()
+    while _recent_keys and now - next(iter(_recent_keys.values())) > RECENT_KEYS_TTL:
+        _recent_keys.popitem(last=False)
 
-    try:
-        _table.put_item(
-            Item=item,
-            # Unique device_id + ts
-            ConditionExpression="attribute_not_exists(SK)",
+    if key in _recent_keys:
+        logger.info(
+            "Duplicate event ignored",
+            extra={"device_id": payload.device_id, "ts": payload.ts},
+        )
+        return _response(
+            409, {"message": "Duplicate event — already accepted"}, request_id
         )
 
-        logger.info("Event stored", extra={"pk": pk, "sk": sk})
-
-    except ClientError as exc:
-        code = exc.response["Error"]["Code"]
-        # Dublicate entry
-        if code == "ConditionalCheckFailedException":
-            logger.info("Duplicate event ignored", extra={"pk": pk, "sk": sk})
-            return _response(
-                409,
-                {
-                    "message": "Duplicate event — already stored",
-                    "request_id": request_id,
-                },
-            )
-        logger.error("DynamoDB write failed", extra={"error": str(exc)})
-        # Error while adding to DB
-        return _response(500, {"error": "Failed to store event"}, request_id)
-
-    # DB insertion success, Add event to SQS
-    sqs_msg = {
+    # Enqueue first, drain_events stores the event in DynamoDB in batches
+    ingest_msg = {
         "device_id": payload.device_id,
         "type": payload.type,
         "value": payload.value,
         "ts": payload.ts,
+        "raw": payload.raw,
+        "ingested_at": int(time() * 1000),
         "request_id": request_id,
-        "event_id": f"{pk}:{sk}",
     }
 
     try:
-        resp = _queue.send_message(
-            QueueUrl=SQS_QUEUE_URL,
-            MessageBody=json.dumps(sqs_msg),
+        resp = _get_sqs().send_message(
+            QueueUrl=INGEST_QUEUE_URL,
+            MessageBody=_msg_encoder.encode(ingest_msg).decode(),
+        )
+        # Single log per request on the success path
+        logger.info(
+            "Event enqueued",
+            extra={"request_id": request_id, "message_id": resp["MessageId"]},
         )
-        logger.info("Event enqueued", extra={"message_id": resp["MessageId"]})
 
-    except ClientError as exc:
+    except (ClientError, BotoCoreError) as exc:
         # Enqueue failed, reasons: Network error, SQS does not exists, Permission errors
         logger.error("SQS enqueue failed", extra={"error": str(exc)})
         return _response(500, {"message": "SQS Enqueue failed,", "error": str(exc)})
 
-    # Success in adding to DB, SQS insertion async
+    # Remember only once enqueued, so a failed request can be retried
+    _recent_keys[key] = now
+    if len(_recent_keys) > RECENT_KEYS_MAX:
+        _recent_keys.popitem(last=False)
+
+    # Accepted, storing and rule evaluation happen async
     return _response(
-        201,
+        202,
         {
-            "message": "Event ingested",
+            "message": "Event accepted",
             "device_id": payload.device_id,
             "ts": payload.ts,
             "request_id": request_id,
@@ -203,16 +278,217 @@ def ingest_event(event: dict, context: Any) -> dict:
     )
 
 
+def _to_item(msg: dict) -> dict:
+    """
+    Convert an ingest message to a DynamoDB item
+    """
+    item = {
+        "PK": {"S": "DEVICE#" + msg["device_id"]},
+        "SK": {"S": "TS#" + str(msg["ts"])},
+        "device_id": {"S": msg["device_id"]},
+        "type": {"S": msg["type"]},
+        "value": {"N": repr(msg["value"])},
+        "ts": {"N": str(msg["ts"])},
+        "ingested_at": {"N": str(msg["ingested_at"])},
+        "request_id": {"S": msg["request_id"]},
+    }
+    if msg.get("raw"):
+        item["raw"] = {"S": _msg_encoder.encode(msg["raw"]).decode()}
+    return item
+
+
+def _batch_write(requests: list, attempt: int = 0) -> list:
+    """
+    BatchWriteItem the put requests, retrying UnprocessedItems with
+    exponential backoff and jitter. Returns requests that are still unprocessed
+    """
+    resp = _get_ddb().batch_write_item(
+        RequestItems={EVENTS_TABLE: requests},
+        ReturnConsumedCapacity="NONE",
+        ReturnItemCollectionMetrics="NONE",
+    )
+    unprocessed = resp.get("UnprocessedItems", {}).get(EVENTS_TABLE, [])
+    if not unprocessed or attempt >= BATCH_RETRIES:
+        return unprocessed
+
+    sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt)))
+    return _batch_write(unprocessed, attempt + 1)
+
+
+def _batch_get(keys: list, attempt: int = 0) -> tuple[dict, list]:
+    """
+    Consistent BatchGetItem of (PK, SK) keys, retrying UnprocessedKeys with
+    exponential backoff and jitter.
+    Returns ({(PK, SK): stored request_id}, keys that are still unprocessed)
+    """
+    resp = _get_ddb().batch_get_item(
+        RequestItems={
+            EVENTS_TABLE: {
+                "Keys": [{"PK": {"S": pk}, "SK": {"S": sk}} for pk, sk in keys],
+                "ProjectionExpression": "PK, SK, request_id",
+                "ConsistentRead": True,
+            }
+        },
+        ReturnConsumedCapacity="NONE",
+    )
+    stored = {
+        (row["PK"]["S"], row["SK"]["S"]): row["request_id"]["S"]
+        for row in resp.get("Responses", {}).get(EVENTS_TABLE, [])
+    }
+    unprocessed = [
+        (key["PK"]["S"], key["SK"]["S"])
+        for key in resp.get("UnprocessedKeys", {}).get(EVENTS_TABLE, {}).get("Keys", [])
+    ]
+    if not unprocessed or attempt >= BATCH_RETRIES:
+        return stored, unprocessed
+
+    sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt)))
+    retried, unprocessed = _batch_get(unprocessed, attempt + 1)
+    stored.update(retried)
+    return stored, unprocessed
+
+
+def drain_events(event: dict, context: Any) -> dict:
+    """
+    SQS IngestQueue consumer, BatchSize = 25
+    Skips events whose device_id+ts was already stored when the batch is read,
+    stores the rest with BatchWriteItem, then forwards each stored event to the
+    rules queue. Supports partial batch failure (ReportBatchItemFailures)
+
+    RULES: device_id+ts should be unique. Best effort: the same key arriving in
+    two concurrently drained batches can pass both reads, then the last write
+    wins and both events are forwarded
+    """
+    request_id = context.aws_request_id if context else os.urandom(16).hex()
+
+    failures = []
+    # (PK, SK) -> (messageId, put request)
+    pending = {}
+    for record in event.get("Records", []):
+        try:
+            item = _to_item(_msg_decoder.decode(record["body"]))
+        except (msgspec.DecodeError, KeyError, TypeError) as exc:
+            # Poison message, retried until it lands in the DLQ
+            logger.error(
+                "Malformed ingest message",
+                extra={"message_id": record["messageId"], "error": str(exc)},
+            )
+            failures.append(record["messageId"])
+            continue
+
+        key = (item["PK"]["S"], item["SK"]["S"])
+        # A batch may not repeat a key, first message wins
+        if key in pending:
+            logger.info("Duplicate event ignored", extra={"pk": key[0], "sk": key[1]})
+            continue
+        pending[key] = (record["messageId"], {"PutRequest": {"Item": item}})
+
+    # Check which keys are already stored, BatchWriteItem would blindly overwrite them
+    keys = list(pending)
+    stored = {}
+    for start in range(0, len(keys), BATCH_GET_MAX):
+        chunk = keys[start : start + BATCH_GET_MAX]
+        try:
+            found, unchecked = _batch_get(chunk)
+        except (ClientError, BotoCoreError) as exc:
+            logger.error("DynamoDB batch get failed", extra={"error": str(exc)})
+            found, unchecked = {}, chunk
+        stored.update(found)
+
+        for key in unchecked:
+            message_id, _ = pending.pop(key)
+            failures.append(message_id)
+
+    requests = []
+    for key, (message_id, put) in list(pending.items()):
+        if key not in stored:
+            requests.append(put)
+        elif stored[key] != put["PutRequest"]["Item"]["request_id"]["S"]:
+            # device_id+ts taken by another request: ack, never store or forward
+            logger.info("Duplicate event ignored", extra={"pk": key[0], "sk": key[1]})
+            del pending[key]
+        # Same request already stored: a redelivery after a failed forward, forward only
+
+    for start in range(0, len(requests), BATCH_WRITE_MAX):
+        chunk = requests[start : start + BATCH_WRITE_MAX]
+        try:
+            unprocessed = _batch_write(chunk)
+        except (ClientError, BotoCoreError) as exc:
+            logger.error("DynamoDB batch write failed", extra={"error": str(exc)})
+            if (
+                not isinstance(exc, ClientError)
+                or exc.response["Error"]["Code"] != "ValidationException"
+            ):
+                unprocessed = chunk
+            else:
+                # One invalid item rejects the whole call, retry one by one so
+                # only the bad record fails
+                unprocessed = []
+                for put in chunk:
+                    try:
+                        unprocessed += _batch_write([put])
+                    except (ClientError, BotoCoreError) as item_exc:
+                        logger.error(
+                            "DynamoDB item write failed", extra={"error": str(item_exc)}
+                        )
+                        unprocessed.append(put)
+
+        for put in unprocessed:
+            item = put["PutRequest"]["Item"]
+            message_id, _ = pending.pop((item["PK"]["S"], item["SK"]["S"]))
+            failures.append(message_id)
+
+    # Stored, Add events to the rules SQS
+    entries = []
+    for (pk, sk), (message_id, put) in pending.items():
+        item = put["PutRequest"]["Item"]
+        sqs_msg = {
+            "device_id": item["device_id"]["S"],
+            "type": item["type"]["S"],
+            "value": float(item["value"]["N"]),
+            "ts": int(item["ts"]["N"]),
+            "request_id": item["request_id"]["S"],
+            "event_id": pk + ":" + sk,
+        }
+        # The source messageId doubles as the batch entry Id
+        entries.append(
+            {"Id": message_id, "MessageBody": _msg_encoder.encode(sqs_msg).decode()}
+        )
+
+    sqs = _get_sqs()
+    for start in range(0, len(entries), SQS_BATCH_MAX):
+        chunk = entries[start : start + SQS_BATCH_MAX]
+        try:
+            resp = sqs.send_message_batch(QueueUrl=SQS_QUEUE_URL, Entries=chunk)
+            failed = [entry["Id"] for entry in resp.get("Failed", [])]
+        except (ClientError, BotoCoreError) as exc:
+            logger.error("SQS enqueue failed", extra={"error": str(exc)})
+            failed = [entry["Id"] for entry in chunk]
+
+        # Retried by SQS, the redelivery finds its own stored item and only forwards
+        failures.extend(failed)
+
+    logger.info(
+        "Events drained",
+        extra={
+            "request_id": request_id,
+            "count": len(event.get("Records", [])),
+            "failed": len(failures),
+        },
+    )
+
+    return {"batchItemFailures": [{"itemIdentifier": m} for m in failures]}
+
+
 def get_device_events(event: dict, context: Any) -> dict:
     """
     HTTP GET /devices/{device_id}/events
     Parameters:
                 - from_ts : +int | OPTIONAL
                 - to_ts   : +int | OPTIONAL
-                - limit   : +int | OPTIONAL default = 100
+                - limit   : +int | OPTIONAL default = 100, max = 100
     """
-    request_id = context.aws_request_id if context else str(uuid.uuid4())
-    logger.info("get_device_events called", extra={"request_id": request_id})
+    request_id = context.aws_request_id if context else os.urandom(16).hex()
 
     # Request validation
     path_params = event.get("pathParameters") or {}
@@ -226,41 +502,58 @@ def get_device_events(event: dict, context: Any) -> dict:
     query_params = event.get("queryStringParameters") or {}
     from_ts = query_params.get("from_ts")
     to_ts = query_params.get("to_ts")
-    limit = int(query_params.get("limit", 100))
+    try:
+        limit = int(query_params.get("limit", MAX_QUERY_LIMIT))
+    except ValueError:
+        return _response(400, {"error": "limit must be an integer"}, request_id)
+    if limit < 1:
+        return _response(400, {"error": "limit must be a positive integer"}, request_id)
+    limit = min(limit, MAX_QUERY_LIMIT)
 
-    pk = f"DEVICE#{device_id}"
+    pk = "DEVICE#" + device_id
 
     # Construct Query
-    key_condition = Key("PK").eq(pk)
-    if from_ts and to_ts:
-        key_condition &= Key("SK").between(f"TS#{from_ts}", f"TS#{to_ts}")
-    elif from_ts:
-        key_condition &= Key("SK").gte(f"TS#{from_ts}")
-    elif to_ts:
-        key_condition &= Key("SK").lte(f"TS#{to_ts}")
+    values = {":pk": {"S": pk}}
+    if from_ts:
+        values[":from_sk"] = {"S": "TS#" + from_ts}
+    if to_ts:
+        values[":to_sk"] = {"S": "TS#" + to_ts}
 
     try:
-        result = _table.query(
-            KeyConditionExpression=key_condition,
+        result = _get_ddb().query(
+            TableName=EVENTS_TABLE,
+            KeyConditionExpression=KEY_CONDITIONS[(bool(from_ts), bool(to_ts))],
+            ExpressionAttributeValues=values,
+            Select="SPECIFIC_ATTRIBUTES",
+            ProjectionExpression=EVENT_PROJECTION,
+            ExpressionAttributeNames=EVENT_PROJECTION_NAMES,
+            ReturnConsumedCapacity="NONE",
             Limit=limit,
+            ConsistentRead=False,
             ScanIndexForward=False,  # reverse the ts ie newest first
         )
 
-    except ClientError as exc:
+    except (ClientError, BotoCoreError) as exc:
         logger.error("DynamoDB query failed", extra={"error": str(exc)})
         return _response(500, {"error": "Failed to retrieve events"}, request_id)
 
-    # Convert value, ts, ingested_at for JSON
-    items = []
-    for row in result.get("Items", []):
-        row["value"] = float(row["value"])
-        row["ts"] = int(row["ts"])
-        row["ingested_at"] = int(row["ingested_at"])
-        items.append(row)
+    # Parse wire format attributes straight into JSON types
+    # ingested_at goes through float, older rows stored fractional milliseconds
+    items = [
+        {
+            "device_id": row["device_id"]["S"],
+            "type": row["type"]["S"],
+            "value": float(row["value"]["N"]),
+            "ts": int(row["ts"]["N"]),
+            "ingested_at": int(float(row["ingested_at"]["N"])),
+            "request_id": row["request_id"]["S"],
+        }
+        for row in result.get("Items", ())
+    ]
 
     logger.info(
         "Events retrieved",
-        extra={"device_id": device_id, "count": len(items)},
+        extra={"request_id": request_id, "device_id": device_id, "count": len(items)},
     )
 
     return _response(
@@ -269,7 +562,11 @@ def get_device_events(event: dict, context: Any) -> dict:
             "device_id": device_id,
             "count": len(items),
             "events": items,
-            "last_evaluated_key": result.get("LastEvaluatedKey"),
+            "last_evaluated_key": {
+                k: v["S"] for k, v in result["LastEvaluatedKey"].items()
+            }
+            if "LastEvaluatedKey" in result
+            else None,
         },
         request_id,
     )
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# handler reads its configuration at import time
+os.environ.setdefault("EVENTS_TABLE", "device_events-test")
+os.environ.setdefault("SQS_QUEUE_URL", "https://sqs.test/events_queue")
+os.environ.setdefault("INGEST_QUEUE_URL", "https://sqs.test/ingest_queue")
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-southeast-2")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
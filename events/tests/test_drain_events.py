@@ -0,0 +1,101 @@
+"""
+drain_events routing against stubbed DynamoDB and SQS clients
+"""
+
+import json
+
+import pytest
+from botocore.stub import ANY, Stubber
+
+import handler
+
+TABLE = handler.EVENTS_TABLE
+
+
+def _record(message_id: str, request_id: str, ts: int = 1000) -> dict:
+    body = {
+        "device_id": "D1",
+        "type": "temperature",
+        "value": 61.2,
+        "ts": ts,
+        "raw": None,
+        "ingested_at": 1760000000000,
+        "request_id": request_id,
+    }
+    return {"messageId": message_id, "body": json.dumps(body)}
+
+
+def _stored(request_id: str, ts: int = 1000) -> dict:
+    return {
+        "PK": {"S": "DEVICE#D1"},
+        "SK": {"S": f"TS#{ts}"},
+        "request_id": {"S": request_id},
+    }
+
+
+@pytest.fixture
+def stubs():
+    with Stubber(handler._get_ddb()) as ddb, Stubber(handler._get_sqs()) as sqs:
+        yield ddb, sqs
+        ddb.assert_no_pending_responses()
+        sqs.assert_no_pending_responses()
+
+
+def _expect_forward(sqs: Stubber, message_ids: list) -> None:
+    sqs.add_response(
+        "send_message_batch",
+        {"Successful": [], "Failed": []},
+        {
+            "QueueUrl": handler.SQS_QUEUE_URL,
+            "Entries": [{"Id": m, "MessageBody": ANY} for m in message_ids],
+        },
+    )
+
+
+def test_duplicate_within_batch_is_written_once(stubs):
+    ddb, sqs = stubs
+    first, repeat = _record("m1", "r1"), _record("m2", "r2")
+    ddb.add_response("batch_get_item", {"Responses": {TABLE: []}})
+    ddb.add_response(
+        "batch_write_item",
+        {"UnprocessedItems": {}},
+        {
+            "RequestItems": {
+                TABLE: [
+                    {
+                        "PutRequest": {
+                            "Item": handler._to_item(json.loads(first["body"]))
+                        }
+                    }
+                ]
+            },
+            "ReturnConsumedCapacity": "NONE",
+            "ReturnItemCollectionMetrics": "NONE",
+        },
+    )
+    _expect_forward(sqs, ["m1"])
+
+    result = handler.drain_events({"Records": [first, repeat]}, None)
+
+    assert result == {"batchItemFailures": []}
+
+
+def test_same_request_redelivery_is_forwarded_without_rewrite(stubs):
+    ddb, sqs = stubs
+    ddb.add_response("batch_get_item", {"Responses": {TABLE: [_stored("r1")]}})
+    # No batch_write_item expected, the stubber fails on an unexpected call
+    _expect_forward(sqs, ["m1"])
+
+    result = handler.drain_events({"Records": [_record("m1", "r1")]}, None)
+
+    assert result == {"batchItemFailures": []}
+
+
+def test_other_request_on_stored_key_is_dropped(stubs):
+    ddb, _ = stubs
+    ddb.add_response("batch_get_item", {"Responses": {TABLE: [_stored("r0")]}})
+    # Neither a write nor a forward is expected
+
+    result = handler.drain_events({"Records": [_record("m1", "r1")]}, None)
+
+    assert result == {"batchItemFailures": []}